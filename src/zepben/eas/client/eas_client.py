@@ -5,10 +5,11 @@
 #  file, You can obtain one at https://mozilla.org/MPL/2.0/.
 import ssl
 import warnings
-from asyncio import get_event_loop
+from asyncio import AbstractEventLoop, Future, ensure_future, get_event_loop, get_running_loop, new_event_loop, \
+    set_event_loop, shield
 from hashlib import sha256
-from json import dumps
-from typing import Optional
+from json import dumps, loads
+from typing import Optional, Tuple
 
 import aiohttp
 from aiohttp import ClientSession
@@ -17,11 +18,59 @@ from zepben.auth import AuthMethod, ZepbenTokenFetcher, create_token_fetcher, cr
 
 from zepben.eas.client.study import Study
 from zepben.eas.client.util import construct_url
-from zepben.eas.client.work_package import WorkPackageConfig, FixedTime, TimePeriod
+from zepben.eas.client.work_package import WorkPackageConfig, FixedTime, TimePeriod, GeneratorConfig, ModelConfig, \
+    ResultProcessorConfig
 
 __all__ = ["EasClient"]
 
 
+def _compact_graphql(document: str) -> str:
+    """
+    Collapse the indentation and line breaks in a GraphQL document so they aren't sent with every request.
+    """
+    return " ".join(document.split())
+
+
+_RUN_WORK_PACKAGE_MUTATION = _compact_graphql("""
+    mutation runWorkPackage($input: WorkPackageInput!, $workPackageName: String!) {
+        runWorkPackage(input: $input, workPackageName: $workPackageName)
+    }
+""")
+
+_CANCEL_WORK_PACKAGE_MUTATION = _compact_graphql("""
+    mutation cancelWorkPackage($workPackageId: ID!) {
+        cancelWorkPackage(workPackageId: $workPackageId)
+    }
+""")
+
+_GET_WORK_PACKAGE_PROGRESS_QUERY = _compact_graphql("""
+    query getWorkPackageProgress {
+        getWorkPackageProgress {
+            pending
+            inProgress {
+               id
+               progressPercent
+               pending
+               generation
+               execution
+               resultProcessing
+               failureProcessing
+               complete
+            }
+        }
+    }
+""")
+
+# Requests without variables are serialised once up front and sent as-is.
+_GET_WORK_PACKAGE_PROGRESS_BODY = dumps({"query": _GET_WORK_PACKAGE_PROGRESS_QUERY, "variables": {}}).encode("utf-8")
+
+_UPLOAD_STUDY_MUTATION = _compact_graphql("""
+    mutation uploadStudy($study: StudyInput!) {
+        addStudies(studies: [$study])
+    }
+""")
+
+
 class EasClient:
     """
     A class used to represent a client to the Evolve App Server, with methods that represent requests to its API.
@@ -74,16 +123,20 @@ class EasClient:
         :param verify_certificate: Set this to "False" to disable certificate verification. This will also apply to the
                                    auth provider if auth is initialised via client id + username + password or
                                    client_id + client_secret. (Defaults to True)
-        :param ca_filename: Path to CA file to use for verification. (Optional)
+        :param ca_filename: Path to CA file to use for verification. It is loaded once, on the first request. (Optional)
         :param session: aiohttp ClientSession to use, if not provided a new session will be created for you. You should
-                        typically only use one aiohttp session per application.
+                        typically only use one aiohttp session per application. Provide your own session if you need
+                        to tune its connector (connection limits, keep-alive, DNS caching) beyond the defaults.
         :param json_serialiser: JSON serialiser to use for requests e.g. ujson.dumps. (Defaults to json.dumps)
         """
         self._protocol = protocol
         self._host = host
         self._port = port
+        self._graphql_url = construct_url(protocol=protocol, host=host, port=port, path="/api/graphql")
         self._verify_certificate = verify_certificate
         self._ca_filename = ca_filename
+        self._ssl_context = None
+        self._progress_request: Optional[Future] = None
         self._access_token = access_token
         if protocol != "https" and (token_fetcher or client_id or access_token):
             raise ValueError(
@@ -111,35 +164,28 @@ class EasClient:
                 verify_conf=self._verify_certificate,
             )
             if self._token_fetcher:
-                self._token_fetcher.token_request_data.update({
-                    'client_id': client_id,
-                    'scope':
-                        'trusted' if self._token_fetcher.auth_method is AuthMethod.SELF
-                        else 'offline_access openid profile email0'
-                })
-                self._token_fetcher.refresh_request_data.update({
-                    "grant_type": "refresh_token",
+                is_self_auth = self._token_fetcher.auth_method is AuthMethod.SELF
+                base_request_data = {
                     'client_id': client_id,
-                    'scope':
-                        'trusted' if self._token_fetcher.auth_method is AuthMethod.SELF
-                        else 'offline_access openid profile email0'
-                })
+                    'scope': 'trusted' if is_self_auth else 'offline_access openid profile email0'
+                }
+                self._token_fetcher.refresh_request_data.update(base_request_data, grant_type='refresh_token')
                 if username and password:
-                    self._token_fetcher.token_request_data.update({
+                    token_request_data = {
+                        **base_request_data,
                         'grant_type': 'password',
                         'username': username,
-                        'password':
-                            sha256(password.encode('utf-8')).hexdigest()
-                            if self._token_fetcher.auth_method is AuthMethod.SELF
-                            else password
-                    })
+                        'password': sha256(password.encode('utf-8')).hexdigest() if is_self_auth else password
+                    }
                     if client_secret:
-                        self._token_fetcher.token_request_data.update({'client_secret': client_secret})
+                        token_request_data['client_secret'] = client_secret
+                    self._token_fetcher.token_request_data.update(token_request_data)
                 elif client_secret:
-                    self._token_fetcher.token_request_data.update({
-                        'grant_type': 'client_credentials',
-                        'client_secret': client_secret
-                    })
+                    self._token_fetcher.token_request_data.update(
+                        base_request_data,
+                        grant_type='client_credentials',
+                        client_secret=client_secret
+                    )
                 else:
                     # Attempt azure managed identity (what a hack)
                     url = "http://169.254.169.254/metadata/identity/oauth2/token?api-version=2018-02-01"
@@ -152,8 +198,10 @@ class EasClient:
         else:
             self._token_fetcher = None
 
+        self._loop = _get_event_loop()
         if session is None:
-            conn = aiohttp.TCPConnector(limit=200, limit_per_host=0)
+            # Keep idle connections and resolved addresses around long enough to be reused between progress polls.
+            conn = aiohttp.TCPConnector(limit=200, limit_per_host=0, keepalive_timeout=60, ttl_dns_cache=300)
             timeout = aiohttp.ClientTimeout(total=60)
             self.session = aiohttp.ClientSession(json_serialize=json_serialiser or dumps, connector=conn,
                                                  timeout=timeout)
@@ -161,19 +209,80 @@ class EasClient:
             self.session = session
 
     def close(self):
-        return get_event_loop().run_until_complete(self.aclose())
+        """
+        Close the client's session. Prefer `aclose` when using the client from async code.
+        """
+        if self.session.closed:
+            return
+        return self._loop.run_until_complete(self.aclose())
 
     async def aclose(self):
         await self.session.close()
 
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
     def _get_request_headers(self, content_type: str = "application/json") -> dict:
         headers = {"content-type": content_type}
         if self._access_token:
             headers["authorization"] = f"Bearer {self._access_token}"
         elif self._token_fetcher:
-            headers["authorization"] = self._token_fetcher.fetch_token()
+            headers["authorization"] = self._fetch_token()
         return headers
 
+    def _fetch_token(self) -> str:
+        if self._verify_certificate:
+            return self._token_fetcher.fetch_token()
+
+        # The token fetcher uses requests, which warns on every unverified request.
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", category=InsecureRequestWarning)
+            return self._token_fetcher.fetch_token()
+
+    def _get_ssl(self):
+        if not self._verify_certificate:
+            return False
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context(cafile=self._ca_filename)
+        return self._ssl_context
+
+    def _post(self, json: Optional[dict] = None, data: Optional[bytes] = None):
+        return self.session.post(
+            self._graphql_url,
+            headers=self._get_request_headers(),
+            json=json if data is None else None,
+            data=data,
+            ssl=self._get_ssl()
+        )
+
+    async def _do_post_request(self, json: Optional[dict] = None, data: Optional[bytes] = None):
+        """
+        Post a GraphQL request to the Evolve App Server.
+
+        :param json: The request body, which will be serialised with the session's JSON serialiser.
+        :param data: A pre-serialised JSON request body. Takes the place of `json` when provided.
+        :return: The decoded JSON response if the request was successful, otherwise the response text.
+        """
+        async with self._post(json=json, data=data) as response:
+            if response.ok:
+                response = await response.json()
+            else:
+                response = await response.text()
+            return response
+
+    async def _do_post_request_text(self, data: bytes) -> Tuple[bool, str]:
+        """
+        Post a pre-serialised GraphQL request to the Evolve App Server without decoding the response.
+
+        :param data: A pre-serialised JSON request body.
+        :return: Whether the request was successful, and the response text.
+        """
+        async with self._post(data=data) as response:
+            return response.ok, await response.text()
+
     def run_hosting_capacity_work_package(self, work_package: WorkPackageConfig):
         """
         Send request to hosting capacity service to run work package
@@ -181,7 +290,7 @@ class EasClient:
         :param work_package: An instance of the `WorkPackageConfig` data class representing the work package configuration for the run
         :return: The HTTP response received from the Evolve App Server after attempting to run work package
         """
-        return get_event_loop().run_until_complete(self.async_run_hosting_capacity_work_package(work_package))
+        return self._loop.run_until_complete(self.async_run_hosting_capacity_work_package(work_package))
 
     async def async_run_hosting_capacity_work_package(self, work_package: WorkPackageConfig):
         """
@@ -190,141 +299,14 @@ class EasClient:
         :param work_package: An instance of the `WorkPackageConfig` data class representing the work package configuration for the run
         :return: The HTTP response received from the Evolve App Server after attempting to run work package
         """
-        with warnings.catch_warnings():
-            if not self._verify_certificate:
-                warnings.filterwarnings("ignore", category=InsecureRequestWarning)
-            json = {
-                "query": """
-                    mutation runWorkPackage($input: WorkPackageInput!, $workPackageName: String!) {
-                        runWorkPackage(input: $input, workPackageName: $workPackageName)
-                    }
-                """,
-                "variables": {
-                    "workPackageName": work_package.name,
-                    "input": {
-                        "feeders": work_package.feeders,
-                        "years": work_package.years,
-                        "scenarios": work_package.scenarios,
-                        "fixedTime": work_package.load_time.time.isoformat()
-                        if isinstance(work_package.load_time, FixedTime) else None,
-                        "timePeriod": {
-                            "startTime": work_package.load_time.start_time.isoformat(),
-                            "endTime": work_package.load_time.end_time.isoformat(),
-                        } if isinstance(work_package.load_time, TimePeriod) else None,
-                        "qualityAssuranceProcessing": work_package.quality_assurance_processing,
-                        "generatorConfig": {
-                            "model": {
-                                "vmPu": work_package.generator_config.model.vm_pu,
-                                "vMinPu": work_package.generator_config.model.vmin_pu,
-                                "vMaxPu": work_package.generator_config.model.vmax_pu,
-                                "loadModel": work_package.generator_config.model.load_model,
-                                "collapseSWER": work_package.generator_config.model.collapse_swer,
-                                "calibration": work_package.generator_config.model.calibration,
-                                "pFactorBaseExports": work_package.generator_config.model.p_factor_base_exports,
-                                "pFactorForecastPv": work_package.generator_config.model.p_factor_forecast_pv,
-                                "pFactorBaseImports": work_package.generator_config.model.p_factor_base_imports,
-                                "fixSinglePhaseLoads": work_package.generator_config.model.fix_single_phase_loads,
-                                "maxSinglePhaseLoad": work_package.generator_config.model.max_single_phase_load,
-                                "fixOverloadingConsumers": work_package.generator_config.model.fix_overloading_consumers,
-                                "maxLoadTxRatio": work_package.generator_config.model.max_load_tx_ratio,
-                                "maxGenTxRatio": work_package.generator_config.model.max_gen_tx_ratio,
-                                "fixUndersizedServiceLines": work_package.generator_config.model.fix_undersized_service_lines,
-                                "maxLoadServiceLineRatio": work_package.generator_config.model.max_load_service_line_ratio,
-                                "maxLoadLvLineRatio": work_package.generator_config.model.max_load_lv_line_ratio,
-                                "collapseLvNetworks": work_package.generator_config.model.collapse_lv_networks,
-                                "feederScenarioAllocationStrategy": work_package.generator_config.model.feeder_scenario_allocation_strategy.name if work_package.generator_config.model.feeder_scenario_allocation_strategy is not None else None,
-                                "closedLoopVRegEnabled": work_package.generator_config.model.closed_loop_v_reg_enabled,
-                                "closedLoopVRegReplaceAll": work_package.generator_config.model.closed_loop_v_reg_replace_all,
-                                "closedLoopVRegSetPoint": work_package.generator_config.model.closed_loop_v_reg_set_point,
-                                "closedLoopVBand": work_package.generator_config.model.closed_loop_v_band,
-                                "closedLoopTimeDelay": work_package.generator_config.model.closed_loop_time_delay,
-                                "closedLoopVLimit": work_package.generator_config.model.closed_loop_v_limit,
-                                "defaultTapChangerTimeDelay": work_package.generator_config.model.default_tap_changer_time_delay,
-                                "defaultTapChangerSetPointPu": work_package.generator_config.model.default_tap_changer_set_point_pu,
-                                "defaultTapChangerBand": work_package.generator_config.model.default_tap_changer_band,
-                                "splitPhaseDefaultLoadLossPercentage": work_package.generator_config.model.split_phase_default_load_loss_percentage,
-                                "splitPhaseLVKV": work_package.generator_config.model.split_phase_lv_kv,
-                                "swerVoltageToLineVoltage": work_package.generator_config.model.swer_voltage_to_line_voltage,
-                                "loadPlacement": work_package.generator_config.model.load_placement.name if work_package.generator_config.model.load_placement is not None else None,
-                                "loadIntervalLengthHours": work_package.generator_config.model.load_interval_length_hours,
-                                "meterPlacementConfig": {
-                                    "feederHead": work_package.generator_config.model.meter_placement_config.feeder_head,
-                                    "distTransformers": work_package.generator_config.model.meter_placement_config.dist_transformers,
-                                    "switchMeterPlacementConfigs": [{
-                                        "meterSwitchClass": spc.meter_switch_class.name if spc.meter_switch_class is not None else None,
-                                        "namePattern": spc.name_pattern
-                                    } for spc in
-                                        work_package.generator_config.model.meter_placement_config.switch_meter_placement_configs] if work_package.generator_config.model.meter_placement_config.switch_meter_placement_configs is not None else None,
-                                    "energyConsumerMeterGroup": work_package.generator_config.model.meter_placement_config.energy_consumer_meter_group
-                                } if work_package.generator_config.model.meter_placement_config is not None else None,
-                                "seed": work_package.generator_config.model.seed,
-                            } if work_package.generator_config.model is not None else None,
-                            "solve": {
-                                "normVMinPu": work_package.generator_config.solve.norm_vmin_pu,
-                                "normVMaxPu": work_package.generator_config.solve.norm_vmax_pu,
-                                "emergVMinPu": work_package.generator_config.solve.emerg_vmin_pu,
-                                "emergVMaxPu": work_package.generator_config.solve.emerg_vmax_pu,
-                                "baseFrequency": work_package.generator_config.solve.base_frequency,
-                                "voltageBases": work_package.generator_config.solve.voltage_bases,
-                                "maxIter": work_package.generator_config.solve.max_iter,
-                                "maxControlIter": work_package.generator_config.solve.max_control_iter,
-                                "mode": work_package.generator_config.solve.mode.name if work_package.generator_config.solve.mode is not None else None,
-                                "stepSizeMinutes": work_package.generator_config.solve.step_size_minutes
-                            } if work_package.generator_config.solve is not None else None,
-                            "rawResults": {
-                                "energyMeterVoltagesRaw": work_package.generator_config.raw_results.energy_meter_voltages_raw,
-                                "energyMetersRaw": work_package.generator_config.raw_results.energy_meters_raw,
-                                "resultsPerMeter": work_package.generator_config.raw_results.results_per_meter,
-                                "overloadsRaw": work_package.generator_config.raw_results.overloads_raw,
-                                "voltageExceptionsRaw": work_package.generator_config.raw_results.voltage_exceptions_raw
-                            } if work_package.generator_config.raw_results is not None else None
-                        } if work_package.generator_config is not None else None,
-                        "executorConfig": {},
-                        "resultProcessorConfig": {
-                            "storedResults": {
-                                "energyMeterVoltagesRaw": work_package.result_processor_config.stored_results.energy_meter_voltages_raw,
-                                "energyMetersRaw": work_package.result_processor_config.stored_results.energy_meters_raw,
-                                "overloadsRaw": work_package.result_processor_config.stored_results.overloads_raw,
-                                "voltageExceptionsRaw": work_package.result_processor_config.stored_results.voltage_exceptions_raw,
-                            } if work_package.result_processor_config.stored_results is not None else None,
-                            "metrics": {
-                                "calculatePerformanceMetrics": work_package.result_processor_config.metrics.calculate_performance_metrics
-                            } if work_package.result_processor_config.metrics is not None else None,
-                            "writerConfig": {
-                                "writerType": work_package.result_processor_config.writer_config.writer_type.name if work_package.result_processor_config.writer_config.writer_type is not None else None,
-                                "outputWriterConfig": {
-                                    "enhancedMetricsConfig": {
-                                        "populateEnhancedMetrics": work_package.result_processor_config.writer_config.output_writer_config.enhanced_metrics_config.populate_enhanced_metrics,
-                                        "populateEnhancedMetricsProfile": work_package.result_processor_config.writer_config.output_writer_config.enhanced_metrics_config.populate_enhanced_metrics_profile,
-                                        "populateDurationCurves": work_package.result_processor_config.writer_config.output_writer_config.enhanced_metrics_config.populate_duration_curves,
-                                        "populateConstraints": work_package.result_processor_config.writer_config.output_writer_config.enhanced_metrics_config.populate_constraints,
-                                        "populateWeeklyReports": work_package.result_processor_config.writer_config.output_writer_config.enhanced_metrics_config.populate_weekly_reports,
-                                        "calculateNormalForLoadThermal": work_package.result_processor_config.writer_config.output_writer_config.enhanced_metrics_config.calculate_normal_for_load_thermal,
-                                        "calculateEmergForLoadThermal": work_package.result_processor_config.writer_config.output_writer_config.enhanced_metrics_config.calculate_emerg_for_load_thermal,
-                                        "calculateNormalForGenThermal": work_package.result_processor_config.writer_config.output_writer_config.enhanced_metrics_config.calculate_normal_for_gen_thermal,
-                                        "calculateEmergForGenThermal": work_package.result_processor_config.writer_config.output_writer_config.enhanced_metrics_config.calculate_emerg_for_gen_thermal,
-                                        "calculateCO2": work_package.result_processor_config.writer_config.output_writer_config.enhanced_metrics_config.calculate_co2
-                                    } if work_package.result_processor_config.writer_config.output_writer_config.enhanced_metrics_config is not None else None
-                                } if work_package.result_processor_config.writer_config.output_writer_config is not None else None
-                            } if work_package.result_processor_config.writer_config is not None else None
-                        } if work_package.result_processor_config is not None else None
-                    }
-                }
+        json = {
+            "query": _RUN_WORK_PACKAGE_MUTATION,
+            "variables": {
+                "workPackageName": work_package.name,
+                "input": _work_package_to_json(work_package)
             }
-            if self._verify_certificate:
-                sslcontext = ssl.create_default_context(cafile=self._ca_filename)
-
-            async with self.session.post(
-                    construct_url(protocol=self._protocol, host=self._host, port=self._port, path="/api/graphql"),
-                    headers=self._get_request_headers(),
-                    json=json,
-                    ssl=sslcontext if self._verify_certificate else False
-            ) as response:
-                if response.ok:
-                    response = await response.json()
-                else:
-                    response = await response.text()
-                return response
+        }
+        return await self._do_post_request(json)
 
     def cancel_hosting_capacity_work_package(self, work_package_id: str):
         """
@@ -333,7 +315,7 @@ class EasClient:
         :param work_package_id: The id of the running work package to cancel
         :return: The HTTP response received from the Evolve App Server after attempting to cancel work package
         """
-        return get_event_loop().run_until_complete(self.async_cancel_hosting_capacity_work_package(work_package_id))
+        return self._loop.run_until_complete(self.async_cancel_hosting_capacity_work_package(work_package_id))
 
     async def async_cancel_hosting_capacity_work_package(self, work_package_id: str):
         """
@@ -342,31 +324,11 @@ class EasClient:
         :param work_package_id: The id of the running work package to cancel
         :return: The HTTP response received from the Evolve App Server after attempting to cancel work package
         """
-        with warnings.catch_warnings():
-            if not self._verify_certificate:
-                warnings.filterwarnings("ignore", category=InsecureRequestWarning)
-            json = {
-                "query": """
-                    mutation cancelWorkPackage($workPackageId: ID!) {
-                        cancelWorkPackage(workPackageId: $workPackageId)
-                    }
-                """,
-                "variables": {"workPackageId": work_package_id}
-            }
-            if self._verify_certificate:
-                sslcontext = ssl.create_default_context(cafile=self._ca_filename)
-
-            async with self.session.post(
-                    construct_url(protocol=self._protocol, host=self._host, port=self._port, path="/api/graphql"),
-                    headers=self._get_request_headers(),
-                    json=json,
-                    ssl=sslcontext if self._verify_certificate else False
-            ) as response:
-                if response.ok:
-                    response = await response.json()
-                else:
-                    response = await response.text()
-                return response
+        json = {
+            "query": _CANCEL_WORK_PACKAGE_MUTATION,
+            "variables": {"workPackageId": work_package_id}
+        }
+        return await self._do_post_request(json)
 
     def get_hosting_capacity_work_packages_progress(self):
         """
@@ -374,58 +336,35 @@ class EasClient:
 
         :return: The HTTP response received from the Evolve App Server after requesting work packages progress info
         """
-        return get_event_loop().run_until_complete(self.async_get_hosting_capacity_work_packages_progress())
+        return self._loop.run_until_complete(self.async_get_hosting_capacity_work_packages_progress())
 
     async def async_get_hosting_capacity_work_packages_progress(self):
         """
-        Asynchronously retrieve running work packages progress information from hosting capacity service
+        Asynchronously retrieve running work packages progress information from hosting capacity service. Concurrent
+        calls share a single in-flight request to the Evolve App Server, and each caller decodes its own copy of the
+        response.
 
         :return: The HTTP response received from the Evolve App Server after requesting work packages progress info
         """
-        with warnings.catch_warnings():
-            if not self._verify_certificate:
-                warnings.filterwarnings("ignore", category=InsecureRequestWarning)
-            json = {
-                "query": """
-                    query getWorkPackageProgress {
-                        getWorkPackageProgress {
-                            pending
-                            inProgress {
-                               id
-                               progressPercent
-                               pending
-                               generation
-                               execution
-                               resultProcessing
-                               failureProcessing
-                               complete
-                            }
-                        }
-                    }
-                """,
-                "variables": {}
-            }
-            if self._verify_certificate:
-                sslcontext = ssl.create_default_context(cafile=self._ca_filename)
-
-            async with self.session.post(
-                    construct_url(protocol=self._protocol, host=self._host, port=self._port, path="/api/graphql"),
-                    headers=self._get_request_headers(),
-                    json=json,
-                    ssl=sslcontext if self._verify_certificate else False
-            ) as response:
-                if response.ok:
-                    response = await response.json()
-                else:
-                    response = await response.text()
-                return response
+        if self._progress_request is None:
+            self._progress_request = ensure_future(self._do_post_request_text(_GET_WORK_PACKAGE_PROGRESS_BODY))
+            self._progress_request.add_done_callback(self._clear_progress_request)
+        # Shield the shared request so one caller being cancelled doesn't cancel it for everyone else.
+        ok, text = await shield(self._progress_request)
+        return loads(text) if ok else text
+
+    def _clear_progress_request(self, request: Future):
+        self._progress_request = None
+        # Retrieve the exception so it isn't reported as never retrieved if every caller was cancelled before it failed.
+        if not request.cancelled():
+            request.exception()
 
     def upload_study(self, study: Study):
         """
         Uploads a new study to the Evolve App Server
         :param study: An instance of a data class representing a new study
         """
-        return get_event_loop().run_until_complete(self.async_upload_study(study))
+        return self._loop.run_until_complete(self.async_upload_study(study))
 
     async def async_upload_study(self, study: Study):
         """
@@ -433,54 +372,193 @@ class EasClient:
         :param study: An instance of a data class representing a new study
         :return: The HTTP response received from the Evolve App Server after attempting to upload the study
         """
-        with warnings.catch_warnings():
-            if not self._verify_certificate:
-                warnings.filterwarnings("ignore", category=InsecureRequestWarning)
-            json = {
-                "query": """
-                    mutation uploadStudy($study: StudyInput!) {
-                        addStudies(studies: [$study])
-                    }
-                """,
-                "variables": {
-                    "study": {
-                        "name": study.name,
-                        "description": study.description,
-                        "tags": study.tags,
-                        "styles": study.styles,
-                        "results": [{
-                            "name": result.name,
-                            "geoJsonOverlay": {
-                                "data": result.geo_json_overlay.data,
-                                "sourceProperties": result.geo_json_overlay.source_properties,
-                                "styles": result.geo_json_overlay.styles
-                            } if result.geo_json_overlay else None,
-                            "stateOverlay": {
-                                "data": result.state_overlay.data,
-                                "styles": result.state_overlay.styles
-                            } if result.state_overlay else None,
-                            "sections": [{
-                                "type": section.type,
-                                "name": section.name,
-                                "description": section.description,
-                                "columns": section.columns,
-                                "data": section.data
-                            } for section in result.sections]
-                        } for result in study.results]
-                    }
+        json = {
+            "query": _UPLOAD_STUDY_MUTATION,
+            "variables": {
+                "study": {
+                    "name": study.name,
+                    "description": study.description,
+                    "tags": study.tags,
+                    "styles": study.styles,
+                    "results": [{
+                        "name": result.name,
+                        "geoJsonOverlay": {
+                            "data": result.geo_json_overlay.data,
+                            "sourceProperties": result.geo_json_overlay.source_properties,
+                            "styles": result.geo_json_overlay.styles
+                        } if result.geo_json_overlay else None,
+                        "stateOverlay": {
+                            "data": result.state_overlay.data,
+                            "styles": result.state_overlay.styles
+                        } if result.state_overlay else None,
+                        "sections": [{
+                            "type": section.type,
+                            "name": section.name,
+                            "description": section.description,
+                            "columns": section.columns,
+                            "data": section.data
+                        } for section in result.sections]
+                    } for result in study.results]
                 }
             }
-            if self._verify_certificate:
-                sslcontext = ssl.create_default_context(cafile=self._ca_filename)
-
-            async with self.session.post(
-                    construct_url(protocol=self._protocol, host=self._host, port=self._port, path="/api/graphql"),
-                    headers=self._get_request_headers(),
-                    json=json,
-                    ssl=sslcontext if self._verify_certificate else False
-            ) as response:
-                if response.ok:
-                    response = await response.json()
-                else:
-                    response = await response.text()
-                return response
+        }
+        return await self._do_post_request(json)
+
+
+def _get_event_loop() -> AbstractEventLoop:
+    """
+    Get the event loop the client should run its requests on. This is the running loop if there is one, otherwise the
+    current thread's event loop, which is created if the thread doesn't have one yet.
+    """
+    try:
+        return get_running_loop()
+    except RuntimeError:
+        pass
+
+    try:
+        with warnings.catch_warnings():
+            # Fetching the current loop outside a coroutine is deprecated, but it is the loop an aiohttp session
+            # created from synchronous code will be bound to.
+            warnings.simplefilter("ignore", DeprecationWarning)
+            return get_event_loop()
+    except RuntimeError:
+        loop = new_event_loop()
+        set_event_loop(loop)
+        return loop
+
+
+def _work_package_to_json(work_package: WorkPackageConfig) -> dict:
+    wp = {
+        "feeders": work_package.feeders,
+        "years": work_package.years,
+        "scenarios": work_package.scenarios,
+        "qualityAssuranceProcessing": work_package.quality_assurance_processing,
+        "executorConfig": {}
+    }
+    if isinstance(work_package.load_time, FixedTime):
+        wp["fixedTime"] = work_package.load_time.time.isoformat()
+    elif isinstance(work_package.load_time, TimePeriod):
+        wp["timePeriod"] = {
+            "startTime": work_package.load_time.start_time.isoformat(),
+            "endTime": work_package.load_time.end_time.isoformat(),
+        }
+    if (generator_config := work_package.generator_config) is not None:
+        wp["generatorConfig"] = _generator_config_to_json(generator_config)
+    if (result_processor_config := work_package.result_processor_config) is not None:
+        wp["resultProcessorConfig"] = _result_processor_config_to_json(result_processor_config)
+    return wp
+
+
+def _generator_config_to_json(generator_config: GeneratorConfig) -> dict:
+    gc = {}
+    if (model := generator_config.model) is not None:
+        gc["model"] = _model_config_to_json(model)
+    if (solve := generator_config.solve) is not None:
+        gc["solve"] = {
+            "normVMinPu": solve.norm_vmin_pu,
+            "normVMaxPu": solve.norm_vmax_pu,
+            "emergVMinPu": solve.emerg_vmin_pu,
+            "emergVMaxPu": solve.emerg_vmax_pu,
+            "baseFrequency": solve.base_frequency,
+            "voltageBases": solve.voltage_bases,
+            "maxIter": solve.max_iter,
+            "maxControlIter": solve.max_control_iter,
+            "mode": solve.mode.name if solve.mode is not None else None,
+            "stepSizeMinutes": solve.step_size_minutes
+        }
+    if (raw_results := generator_config.raw_results) is not None:
+        gc["rawResults"] = {
+            "energyMeterVoltagesRaw": raw_results.energy_meter_voltages_raw,
+            "energyMetersRaw": raw_results.energy_meters_raw,
+            "resultsPerMeter": raw_results.results_per_meter,
+            "overloadsRaw": raw_results.overloads_raw,
+            "voltageExceptionsRaw": raw_results.voltage_exceptions_raw
+        }
+    return gc
+
+
+def _model_config_to_json(model: ModelConfig) -> dict:
+    mc = {
+        "vmPu": model.vm_pu,
+        "vMinPu": model.vmin_pu,
+        "vMaxPu": model.vmax_pu,
+        "loadModel": model.load_model,
+        "collapseSWER": model.collapse_swer,
+        "calibration": model.calibration,
+        "pFactorBaseExports": model.p_factor_base_exports,
+        "pFactorForecastPv": model.p_factor_forecast_pv,
+        "pFactorBaseImports": model.p_factor_base_imports,
+        "fixSinglePhaseLoads": model.fix_single_phase_loads,
+        "maxSinglePhaseLoad": model.max_single_phase_load,
+        "fixOverloadingConsumers": model.fix_overloading_consumers,
+        "maxLoadTxRatio": model.max_load_tx_ratio,
+        "maxGenTxRatio": model.max_gen_tx_ratio,
+        "fixUndersizedServiceLines": model.fix_undersized_service_lines,
+        "maxLoadServiceLineRatio": model.max_load_service_line_ratio,
+        "maxLoadLvLineRatio": model.max_load_lv_line_ratio,
+        "collapseLvNetworks": model.collapse_lv_networks,
+        "feederScenarioAllocationStrategy": model.feeder_scenario_allocation_strategy.name
+        if model.feeder_scenario_allocation_strategy is not None else None,
+        "closedLoopVRegEnabled": model.closed_loop_v_reg_enabled,
+        "closedLoopVRegReplaceAll": model.closed_loop_v_reg_replace_all,
+        "closedLoopVRegSetPoint": model.closed_loop_v_reg_set_point,
+        "closedLoopVBand": model.closed_loop_v_band,
+        "closedLoopTimeDelay": model.closed_loop_time_delay,
+        "closedLoopVLimit": model.closed_loop_v_limit,
+        "defaultTapChangerTimeDelay": model.default_tap_changer_time_delay,
+        "defaultTapChangerSetPointPu": model.default_tap_changer_set_point_pu,
+        "defaultTapChangerBand": model.default_tap_changer_band,
+        "splitPhaseDefaultLoadLossPercentage": model.split_phase_default_load_loss_percentage,
+        "splitPhaseLVKV": model.split_phase_lv_kv,
+        "swerVoltageToLineVoltage": model.swer_voltage_to_line_voltage,
+        "loadPlacement": model.load_placement.name if model.load_placement is not None else None,
+        "loadIntervalLengthHours": model.load_interval_length_hours,
+        "seed": model.seed,
+    }
+    if (meter_placement_config := model.meter_placement_config) is not None:
+        mc["meterPlacementConfig"] = {
+            "feederHead": meter_placement_config.feeder_head,
+            "distTransformers": meter_placement_config.dist_transformers,
+            "switchMeterPlacementConfigs": [{
+                "meterSwitchClass": spc.meter_switch_class.name if spc.meter_switch_class is not None else None,
+                "namePattern": spc.name_pattern
+            } for spc in meter_placement_config.switch_meter_placement_configs]
+            if meter_placement_config.switch_meter_placement_configs is not None else None,
+            "energyConsumerMeterGroup": meter_placement_config.energy_consumer_meter_group
+        }
+    return mc
+
+
+def _result_processor_config_to_json(result_processor_config: ResultProcessorConfig) -> dict:
+    rpc = {}
+    if (stored_results := result_processor_config.stored_results) is not None:
+        rpc["storedResults"] = {
+            "energyMeterVoltagesRaw": stored_results.energy_meter_voltages_raw,
+            "energyMetersRaw": stored_results.energy_meters_raw,
+            "overloadsRaw": stored_results.overloads_raw,
+            "voltageExceptionsRaw": stored_results.voltage_exceptions_raw,
+        }
+    if (metrics := result_processor_config.metrics) is not None:
+        rpc["metrics"] = {
+            "calculatePerformanceMetrics": metrics.calculate_performance_metrics
+        }
+    if (writer_config := result_processor_config.writer_config) is not None:
+        wc = {"writerType": writer_config.writer_type.name if writer_config.writer_type is not None else None}
+        if (output_writer_config := writer_config.output_writer_config) is not None:
+            owc = {}
+            if (enhanced_metrics_config := output_writer_config.enhanced_metrics_config) is not None:
+                owc["enhancedMetricsConfig"] = {
+                    "populateEnhancedMetrics": enhanced_metrics_config.populate_enhanced_metrics,
+                    "populateEnhancedMetricsProfile": enhanced_metrics_config.populate_enhanced_metrics_profile,
+                    "populateDurationCurves": enhanced_metrics_config.populate_duration_curves,
+                    "populateConstraints": enhanced_metrics_config.populate_constraints,
+                    "populateWeeklyReports": enhanced_metrics_config.populate_weekly_reports,
+                    "calculateNormalForLoadThermal": enhanced_metrics_config.calculate_normal_for_load_thermal,
+                    "calculateEmergForLoadThermal": enhanced_metrics_config.calculate_emerg_for_load_thermal,
+                    "calculateNormalForGenThermal": enhanced_metrics_config.calculate_normal_for_gen_thermal,
+                    "calculateEmergForGenThermal": enhanced_metrics_config.calculate_emerg_for_gen_thermal,
+                    "calculateCO2": enhanced_metrics_config.calculate_co2
+                }
+            wc["outputWriterConfig"] = owc
+        rpc["writerConfig"] = wc
+    return rpc
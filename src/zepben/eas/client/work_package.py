@@ -3,6 +3,8 @@
 #  This Source Code Form is subject to the terms of the Mozilla Public
 #  License, v. 2.0. If a copy of the MPL was not distributed with this
 #  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+from __future__ import annotations
+
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
@@ -35,11 +37,11 @@ __all__ = [
 
 
 class SwitchClass(Enum):
-    BREAKER = "BREAKER",
-    DISCONNECTOR = "DISCONNECTOR",
-    FUSE = "FUSE",
-    JUMPER = "JUMPER",
-    LOAD_BREAK_SWITCH = "LOAD_BREAK_SWITCH",
+    BREAKER = "BREAKER"
+    DISCONNECTOR = "DISCONNECTOR"
+    FUSE = "FUSE"
+    JUMPER = "JUMPER"
+    LOAD_BREAK_SWITCH = "LOAD_BREAK_SWITCH"
     RECLOSER = "RECLOSER"
 
 
@@ -52,7 +54,7 @@ class SwitchMeterPlacementConfig:
 class FixedTime:
 
     def __init__(self, time: datetime):
-        self.time = time.replace(tzinfo=None)
+        self.time = time if time.tzinfo is None else time.replace(tzinfo=None)
 
 
 class TimePeriod:
@@ -63,21 +65,32 @@ class TimePeriod:
             end_time: datetime
     ):
         self._validate(start_time, end_time)
-        self.start_time = start_time.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
-        self.end_time = end_time.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+        self.start_time = self._start_of_day(start_time)
+        self.end_time = self._start_of_day(end_time)
+
+    @staticmethod
+    def _start_of_day(time: datetime) -> datetime:
+        if time.tzinfo is None and time.hour == time.minute == time.second == time.microsecond == 0:
+            return time
+        return time.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
 
     @staticmethod
     def _validate(start_time: datetime, end_time: datetime):
-        ddelta = (end_time - start_time).days
+        if (start_time.tzinfo is None) != (end_time.tzinfo is None):
+            raise TypeError("'start_time' and 'end_time' must both be naive or both be timezone aware.")
 
-        if ddelta > 365:
-            raise ValueError("The difference between 'start_time' and 'end_time' cannot be greater than a year.")
+        # Both times are truncated to midnight with their timezone dropped, so compare the calendar days that will
+        # actually be stored rather than building a timedelta.
+        ddelta = end_time.toordinal() - start_time.toordinal()
+
+        if ddelta < 0:
+            raise ValueError("The 'start_time' must be before 'end_time'.")
 
         if ddelta < 1:
             raise ValueError("The difference between 'start_time' and 'end_time' cannot be less than a day.")
 
-        if ddelta < 0:
-            raise ValueError("The 'start_time' must be before 'end_time'.")
+        if ddelta > 365:
+            raise ValueError("The difference between 'start_time' and 'end_time' cannot be greater than a year.")
 
 
 class LoadPlacement(Enum):
@@ -200,7 +213,7 @@ class EnhancedMetricsConfig:
 
 
 class WriterType(Enum):
-    POSTGRES = "POSTGRES",
+    POSTGRES = "POSTGRES"
     PARQUET = "PARQUET"
 
 
@@ -3,20 +3,27 @@
 #  This Source Code Form is subject to the terms of the Mozilla Public
 #  License, v. 2.0. If a copy of the MPL was not distributed with this
 #  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+import asyncio
+import gc
+import json
 import random
 import ssl
 import string
+import warnings
 from datetime import datetime
 from unittest import mock
 
 import pytest
 import trustme
 from pytest_httpserver import HTTPServer
+from urllib3.exceptions import InsecureRequestWarning
+from werkzeug import Request, Response
 from zepben.auth import ZepbenTokenFetcher
 
 from zepben.eas import EasClient, Study
 from zepben.eas.client.study import Result
-from zepben.eas.client.work_package import WorkPackageConfig, TimePeriod
+from zepben.eas.client.work_package import WorkPackageConfig, TimePeriod, GeneratorConfig, RawResultsConfig, \
+    ResultProcessorConfig, MetricsResultsConfig, FixedTime, WriterConfig, WriterType, WriterOutputConfig
 
 mock_host = ''.join(random.choices(string.ascii_lowercase, k=10))
 mock_port = random.randrange(1024)
@@ -100,6 +107,45 @@ def test_get_request_headers_adds_token_from_token_fetcher_in_auth_header(_):
     assert headers["authorization"] == "test_token3"
 
 
+def _fetch_token_with_insecure_request_warning():
+    warnings.warn("Unverified HTTPS request", InsecureRequestWarning)
+    return "test_token4"
+
+
+@mock.patch("zepben.auth.client.zepben_token_fetcher.ZepbenTokenFetcher.fetch_token",
+            side_effect=_fetch_token_with_insecure_request_warning)
+def test_get_request_headers_suppresses_insecure_request_warning_without_verify(_):
+    eas_client = EasClient(
+        mock_host,
+        mock_port,
+        token_fetcher=ZepbenTokenFetcher(audience="fake", token_endpoint="unused"),
+        verify_certificate=False
+    )
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        headers = eas_client._get_request_headers()
+
+    assert headers["authorization"] == "test_token4"
+    assert not [w for w in caught if issubclass(w.category, InsecureRequestWarning)]
+
+
+@mock.patch("zepben.auth.client.zepben_token_fetcher.ZepbenTokenFetcher.fetch_token",
+            side_effect=_fetch_token_with_insecure_request_warning)
+def test_get_request_headers_keeps_insecure_request_warning_with_verify(_):
+    eas_client = EasClient(
+        mock_host,
+        mock_port,
+        token_fetcher=ZepbenTokenFetcher(audience="fake", token_endpoint="unused"),
+        verify_certificate=True
+    )
+
+    with pytest.warns(InsecureRequestWarning):
+        headers = eas_client._get_request_headers()
+
+    assert headers["authorization"] == "test_token4"
+
+
 @mock.patch("zepben.auth.client.zepben_token_fetcher.requests.get", side_effect=lambda *args, **kwargs: MockResponse(
     {"authType": "AUTH0", "audience": mock_audience, "issuer": "test_issuer"}, 200))
 def test_create_eas_client_with_password_success(_):
@@ -165,6 +211,76 @@ def httpserver_ssl_context(localhost_cert):
     return context
 
 
+def test_ssl_context_is_reused_between_requests(ca: trustme.CA):
+    with ca.cert_pem.tempfile() as ca_filename:
+        eas_client = EasClient(
+            LOCALHOST,
+            mock_port,
+            verify_certificate=True,
+            ca_filename=ca_filename
+        )
+
+        ssl_context = eas_client._get_ssl()
+        assert isinstance(ssl_context, ssl.SSLContext)
+        assert eas_client._get_ssl() is ssl_context
+
+
+def test_ssl_is_disabled_without_certificate_verification():
+    eas_client = EasClient(
+        LOCALHOST,
+        mock_port,
+        verify_certificate=False
+    )
+
+    assert eas_client._get_ssl() is False
+
+
+def test_close_after_aclose_does_not_enter_event_loop():
+    eas_client = EasClient(
+        mock_host,
+        mock_port,
+        verify_certificate=False
+    )
+
+    eas_client._loop.run_until_complete(eas_client.aclose())
+    with mock.patch.object(eas_client._loop, "run_until_complete") as run_until_complete:
+        eas_client.close()
+
+    run_until_complete.assert_not_called()
+    assert eas_client.session.closed
+
+
+def test_close_twice_only_enters_event_loop_once():
+    eas_client = EasClient(
+        mock_host,
+        mock_port,
+        verify_certificate=False
+    )
+
+    eas_client.close()
+    assert eas_client.session.closed
+    with mock.patch.object(eas_client._loop, "run_until_complete") as run_until_complete:
+        eas_client.close()
+
+    run_until_complete.assert_not_called()
+
+
+def test_eas_client_closes_session_when_used_as_async_context_manager():
+    eas_client = EasClient(
+        mock_host,
+        mock_port,
+        verify_certificate=False
+    )
+
+    async def use_client():
+        async with eas_client as client:
+            assert client is eas_client
+            assert not client.session.closed
+
+    eas_client._loop.run_until_complete(use_client())
+    assert eas_client.session.closed
+
+
 def test_run_hosting_capacity_work_package_no_verify_success(httpserver: HTTPServer):
     eas_client = EasClient(
         LOCALHOST,
@@ -239,6 +355,93 @@ def test_run_hosting_capacity_work_package_valid_certificate_success(ca: trustme
         assert res == {"data": {"runWorkPackage": "workPackageId"}}
 
 
+def test_run_hosting_capacity_work_package_omits_unset_configs(httpserver: HTTPServer):
+    eas_client = EasClient(
+        LOCALHOST,
+        httpserver.port,
+        verify_certificate=False
+    )
+
+    def handler(request: Request):
+        assert request.get_json()["variables"]["input"] == {
+            "feeders": ["feeder"],
+            "years": [1],
+            "scenarios": ["scenario"],
+            "timePeriod": {"startTime": "2022-01-01T00:00:00", "endTime": "2022-01-02T00:00:00"},
+            "qualityAssuranceProcessing": None,
+            "generatorConfig": {
+                "rawResults": {
+                    "energyMeterVoltagesRaw": None,
+                    "energyMetersRaw": True,
+                    "resultsPerMeter": None,
+                    "overloadsRaw": None,
+                    "voltageExceptionsRaw": None
+                }
+            },
+            "executorConfig": {},
+            "resultProcessorConfig": {"metrics": {"calculatePerformanceMetrics": True}}
+        }
+        return Response(json.dumps({"data": {"runWorkPackage": "workPackageId"}}), content_type="application/json")
+
+    httpserver.expect_oneshot_request("/api/graphql").respond_with_handler(handler)
+    res = eas_client.run_hosting_capacity_work_package(
+        WorkPackageConfig(
+            "wp_name",
+            ["feeder"],
+            [1],
+            ["scenario"],
+            TimePeriod(
+                datetime(2022, 1, 1),
+                datetime(2022, 1, 2)),
+            generator_config=GeneratorConfig(raw_results=RawResultsConfig(energy_meters_raw=True)),
+            result_processor_config=ResultProcessorConfig(metrics=MetricsResultsConfig(True))
+        )
+    )
+    httpserver.check_assertions()
+    assert res == {"data": {"runWorkPackage": "workPackageId"}}
+
+
+def test_run_hosting_capacity_work_package_fixed_time_and_writer_config(httpserver: HTTPServer):
+    eas_client = EasClient(
+        LOCALHOST,
+        httpserver.port,
+        verify_certificate=False
+    )
+
+    def handler(request: Request):
+        assert request.get_json()["variables"]["input"] == {
+            "feeders": ["feeder"],
+            "years": [1],
+            "scenarios": ["scenario"],
+            "fixedTime": "2022-01-01T10:00:00",
+            "qualityAssuranceProcessing": None,
+            "executorConfig": {},
+            "resultProcessorConfig": {
+                "writerConfig": {
+                    "writerType": "POSTGRES",
+                    "outputWriterConfig": {}
+                }
+            }
+        }
+        return Response(json.dumps({"data": {"runWorkPackage": "workPackageId"}}), content_type="application/json")
+
+    httpserver.expect_oneshot_request("/api/graphql").respond_with_handler(handler)
+    res = eas_client.run_hosting_capacity_work_package(
+        WorkPackageConfig(
+            "wp_name",
+            ["feeder"],
+            [1],
+            ["scenario"],
+            FixedTime(datetime(2022, 1, 1, 10)),
+            result_processor_config=ResultProcessorConfig(
+                writer_config=WriterConfig(WriterType.POSTGRES, WriterOutputConfig())
+            )
+        )
+    )
+    httpserver.check_assertions()
+    assert res == {"data": {"runWorkPackage": "workPackageId"}}
+
+
 def test_cancel_hosting_capacity_work_package_no_verify_success(httpserver: HTTPServer):
     eas_client = EasClient(
         LOCALHOST,
@@ -300,6 +503,81 @@ def test_get_hosting_capacity_work_package_progress_no_verify_success(httpserver
     assert res == {"data": {"getWorkPackageProgress": {}}}
 
 
+def test_concurrent_get_hosting_capacity_work_package_progress_share_request(httpserver: HTTPServer):
+    eas_client = EasClient(
+        LOCALHOST,
+        httpserver.port,
+        verify_certificate=False
+    )
+
+    httpserver.expect_oneshot_request("/api/graphql").respond_with_json(
+        {"data": {"getWorkPackageProgress": {}}}
+    )
+    with mock.patch("zepben.eas.client.eas_client.loads", wraps=json.loads) as loads:
+        res1, res2 = eas_client._loop.run_until_complete(asyncio.gather(
+            eas_client.async_get_hosting_capacity_work_packages_progress(),
+            eas_client.async_get_hosting_capacity_work_packages_progress()
+        ))
+    httpserver.check_assertions()
+    assert res1 == {"data": {"getWorkPackageProgress": {}}}
+    assert res2 == {"data": {"getWorkPackageProgress": {}}}
+    # Each caller decodes its own copy of the shared response, so mutating one result doesn't affect the other.
+    assert loads.call_count == 2
+    res1["data"]["getWorkPackageProgress"]["pending"] = ["wp"]
+    assert res2 == {"data": {"getWorkPackageProgress": {}}}
+    assert eas_client._progress_request is None
+
+
+def test_get_hosting_capacity_work_package_progress_decodes_response_once(httpserver: HTTPServer):
+    eas_client = EasClient(
+        LOCALHOST,
+        httpserver.port,
+        verify_certificate=False
+    )
+
+    httpserver.expect_oneshot_request("/api/graphql").respond_with_json(
+        {"data": {"getWorkPackageProgress": {}}}
+    )
+    with mock.patch("zepben.eas.client.eas_client.loads", wraps=json.loads) as loads:
+        res = eas_client.get_hosting_capacity_work_packages_progress()
+    httpserver.check_assertions()
+    assert res == {"data": {"getWorkPackageProgress": {}}}
+    loads.assert_called_once()
+
+
+def test_cancelled_get_hosting_capacity_work_package_progress_failure_is_retrieved():
+    eas_client = EasClient(
+        mock_host,
+        mock_port,
+        verify_certificate=False
+    )
+
+    async def failing_request(*_):
+        await asyncio.sleep(0.01)
+        raise ValueError("progress request failed")
+
+    async def poll_and_cancel():
+        poll = asyncio.ensure_future(eas_client.async_get_hosting_capacity_work_packages_progress())
+        await asyncio.sleep(0)
+        poll.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await poll
+        # Let the shared request fail after its only caller has gone.
+        await asyncio.sleep(0.05)
+
+    exception_handler = mock.Mock()
+    eas_client._loop.set_exception_handler(exception_handler)
+    try:
+        with mock.patch.object(eas_client, "_do_post_request_text", failing_request):
+            eas_client._loop.run_until_complete(poll_and_cancel())
+        gc.collect()
+    finally:
+        eas_client._loop.set_exception_handler(None)
+
+    assert eas_client._progress_request is None
+    exception_handler.assert_not_called()
+
+
 def test_get_hosting_capacity_work_package_progress_invalid_certificate_failure(ca: trustme.CA, httpserver: HTTPServer):
     with trustme.Blob(b"invalid ca").tempfile() as ca_filename:
         eas_client = EasClient(
@@ -0,0 +1,92 @@
+#  Copyright 2024 Zeppelin Bend Pty Ltd
+#
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from zepben.eas.client.work_package import TimePeriod, FixedTime, SwitchClass, WriterType
+
+
+def test_time_period_truncates_to_midnight():
+    time_period = TimePeriod(datetime(2022, 1, 1, 12, 30), datetime(2022, 1, 2, 6))
+
+    assert time_period.start_time == datetime(2022, 1, 1)
+    assert time_period.end_time == datetime(2022, 1, 2)
+
+
+def test_time_period_keeps_naive_midnight_times():
+    start_time = datetime(2022, 1, 1)
+    end_time = datetime(2022, 2, 1)
+    time_period = TimePeriod(start_time, end_time)
+
+    assert time_period.start_time is start_time
+    assert time_period.end_time is end_time
+
+
+def test_time_period_drops_timezone():
+    time_period = TimePeriod(datetime(2022, 1, 1, tzinfo=timezone.utc), datetime(2022, 1, 2, tzinfo=timezone.utc))
+
+    assert time_period.start_time.tzinfo is None
+    assert time_period.end_time.tzinfo is None
+
+
+def test_time_period_accepts_a_full_year():
+    time_period = TimePeriod(datetime(2022, 1, 1), datetime(2023, 1, 1))
+
+    assert time_period.start_time == datetime(2022, 1, 1)
+    assert time_period.end_time == datetime(2023, 1, 1)
+
+
+def test_time_period_rejects_start_after_end():
+    with pytest.raises(ValueError, match="The 'start_time' must be before 'end_time'."):
+        TimePeriod(datetime(2022, 1, 2), datetime(2022, 1, 1))
+
+
+def test_time_period_rejects_less_than_a_day():
+    with pytest.raises(ValueError, match="cannot be less than a day"):
+        TimePeriod(datetime(2022, 1, 1), datetime(2022, 1, 1, 23))
+
+
+def test_time_period_rejects_more_than_a_year():
+    with pytest.raises(ValueError, match="cannot be greater than a year"):
+        TimePeriod(datetime(2022, 1, 1), datetime(2023, 1, 2))
+
+
+def test_time_period_rejects_mixed_naive_and_aware_times():
+    with pytest.raises(TypeError, match="must both be naive or both be timezone aware"):
+        TimePeriod(datetime(2022, 1, 1), datetime(2022, 1, 3, tzinfo=timezone.utc))
+
+    with pytest.raises(TypeError, match="must both be naive or both be timezone aware"):
+        TimePeriod(datetime(2022, 1, 1, tzinfo=timezone.utc), datetime(2022, 1, 3))
+
+
+def test_time_period_validates_aware_times_by_wall_clock_date():
+    # 2022-01-02 01:00 at UTC+10 is still 2022-01-01 in UTC, but the stored period uses the wall clock dates.
+    time_period = TimePeriod(
+        datetime(2022, 1, 1, 12, tzinfo=timezone.utc),
+        datetime(2022, 1, 2, 1, tzinfo=timezone(timedelta(hours=10)))
+    )
+
+    assert time_period.start_time == datetime(2022, 1, 1)
+    assert time_period.end_time == datetime(2022, 1, 2)
+
+
+def test_fixed_time_drops_timezone():
+    fixed_time = FixedTime(datetime(2022, 1, 1, 10, tzinfo=timezone.utc))
+
+    assert fixed_time.time == datetime(2022, 1, 1, 10)
+    assert fixed_time.time.tzinfo is None
+
+
+def test_fixed_time_keeps_naive_time():
+    time = datetime(2022, 1, 1, 10)
+
+    assert FixedTime(time).time is time
+
+
+def test_switch_class_and_writer_type_values_are_plain_strings():
+    assert SwitchClass("BREAKER") is SwitchClass.BREAKER
+    assert WriterType.POSTGRES.value == "POSTGRES"